@@ -1,6 +1,16 @@
 # step_back_pipeline.py
+import logging
+import re
+import httpx
 import ollama
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Union
+
+# Explicit placeholders like {question}, {text}, ...; other braces in the
+# message text (e.g. JSON examples) never match an identifier in braces.
+_PLACEHOLDER = re.compile(r"\{([a-zA-Z_][a-zA-Z0-9_]*)\}")
+
+logger = logging.getLogger(__name__)
+
 
 # --- Minimal prompt template (LangChain-like) ---
 class PromptTemplate:
@@ -12,19 +22,6 @@ class PromptTemplate:
         """
         self.messages = messages
 
-    @staticmethod
-    def from_messages(messages: List[Any]) -> "PromptTemplate":
-        return PromptTemplate(messages)
-
-    def format(self, **kwargs) -> List[Dict[str, str]]:
-        def _safe_format(content: str, mapping: Dict[str, Any]) -> str:
-            # Replace only explicit placeholders like {question}, {text}, ...
-            # without interpreting other braces in the message text (e.g. JSON examples).
-            out = content
-            for k, v in mapping.items():
-                out = out.replace("{" + k + "}", str(v))
-            return out
-
         def _expand(item):
             # item can be ("role", "content") OR a nested list/tuple
             if isinstance(item, (list, tuple)) and len(item) and isinstance(item[0], (list, tuple)):
@@ -35,33 +32,169 @@ class PromptTemplate:
                 return out
             elif isinstance(item, (list, tuple)) and len(item) == 2:
                 role, content = item
-                return [{"role": role, "content": _safe_format(content, kwargs)}]
+                return [(role, content, bool(_PLACEHOLDER.search(content)))]
             else:
                 raise ValueError("Invalid message item: %r" % (item,))
 
-        rendered: List[Dict[str, str]] = []
-        for m in self.messages:
-            rendered += _expand(m)
+        # Render everything once: messages without placeholders (system prompt,
+        # few-shot examples) are final; only the dynamic ones are formatted per call
+        self._static: List[Dict[str, str]] = []
+        self._dynamic: List[Tuple[int, str, str]] = []  # (index, role, template)
+        for m in messages:
+            for role, content, has_placeholders in _expand(m):
+                if has_placeholders:
+                    self._dynamic.append((len(self._static), role, content))
+                self._static.append({"role": role, "content": content})
+
+    @staticmethod
+    def from_messages(messages: List[Any]) -> "PromptTemplate":
+        return PromptTemplate(messages)
+
+    def format(self, **kwargs) -> List[Dict[str, str]]:
+        """
+        Render the messages with the given placeholder values.
+
+        Static message dicts are shared between calls; treat the result as read-only.
+        """
+        def _safe_format(content: str, mapping: Dict[str, Any]) -> str:
+            # Replace only explicit placeholders in one pass; unknown ones are left as-is
+            return _PLACEHOLDER.sub(lambda m: str(mapping[m.group(1)]) if m.group(1) in mapping else m.group(0),
+                                    content)
+
+        rendered = self._static[:]
+        for index, role, template in self._dynamic:
+            rendered[index] = {"role": role, "content": _safe_format(template, kwargs)}
         return rendered
 
 
+# How long Ollama keeps the model loaded after a request. Keeping it resident
+# also keeps the KV cache of the last prompt, so a byte-identical system +
+# few-shot prefix is not prefilled again on the next call.
+DEFAULT_KEEP_ALIVE = "30m"
+
+DEFAULT_BASE_URL = "http://localhost:11434"
+
+# One client per Ollama server, shared by every wrapper in the process so
+# they all reuse the same keep-alive HTTP connection pool.
+_clients: Dict[str, ollama.Client] = {}
+
+
+def get_client(base_url: str = DEFAULT_BASE_URL) -> ollama.Client:
+    """Return the process-wide ollama.Client for base_url."""
+    client = _clients.get(base_url)
+    if client is None:
+        client = _clients.setdefault(base_url, ollama.Client(host=base_url))
+    return client
+
+
+def _log_prompt_eval(model: str, resp: Any) -> None:
+    """
+    Debug-log how much of the prompt the server had to evaluate. When the shared
+    prefix is served from the KV cache, prompt_eval_count stays near the size
+    of the dynamic part and prompt_eval_duration drops accordingly.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s: prompt_eval_count=%s prompt_eval_duration=%.1fms", model,
+                     resp.get("prompt_eval_count"), (resp.get("prompt_eval_duration") or 0) / 1e6)
+
+
+def warm_up(model: str, base_url: str = DEFAULT_BASE_URL,
+            keep_alive: Union[str, float] = DEFAULT_KEEP_ALIVE) -> None:
+    """Load `model` on the server with a 1-token request so the first real call is not cold."""
+    get_client(base_url).generate(model=model, prompt=" ", options={"num_predict": 1},
+                                  keep_alive=keep_alive)
+
+
 # --- LLM wrapper (returns a string like StrOutputParser) ---
 class ChatOllamaMini:
-    def __init__(self, model: str = "gemma3:1b", temperature: float = 0.0, base_url: str = "http://localhost:11434"):
-        # Use a client so we can set base_url explicitly
-        self.client = ollama.Client(host=base_url)
+    def __init__(self, model: str = "gemma3:1b", temperature: float = 0.0, base_url: str = DEFAULT_BASE_URL,
+                 keep_alive: Union[str, float] = DEFAULT_KEEP_ALIVE, options: Optional[Dict[str, Any]] = None):
+        # Shared client for base_url (see get_client)
+        self.client = get_client(base_url)
+        self.base_url = base_url
         self.model = model
         self.temperature = temperature
+        self.keep_alive = keep_alive
+        # Extra Ollama options (num_ctx, num_predict, ...) sent with every request
+        self.options = {"temperature": temperature, **(options or {})}
 
-    def invoke(self, messages: List[Dict[str, str]]) -> str:
+    def warm_up(self) -> None:
+        warm_up(self.model, self.base_url, self.keep_alive)
+
+    def close(self) -> None:
+        """The client is shared per server (see get_client); nothing to close."""
+
+    def invoke(self, messages: List[Dict[str, str]], format: Union[str, Dict[str, Any]] = "") -> str:
+        """format: "json" or a JSON schema to constrain the reply to (default: free text)."""
         resp = self.client.chat(
             model=self.model,
             messages=messages,
-            options={"temperature": self.temperature},
+            format=format,
+            options=self.options,
+            keep_alive=self.keep_alive,
         )
+        _log_prompt_eval(self.model, resp)
         return resp["message"]["content"]
 
 
+# --- Same interface for an OpenAI-compatible server (vLLM, llama.cpp server, ...) ---
+class ChatOpenAICompat:
+    """
+    Drop-in replacement for ChatOllamaMini that talks to a /v1/chat/completions endpoint.
+
+    Servers with continuous batching and prefix caching (e.g. `vllm serve
+    google/gemma-3-1b-it --enable-prefix-caching`) run concurrent requests in
+    one batch and prefill the shared system prompt once.
+    """
+
+    def __init__(self, model: str, temperature: float = 0.0, base_url: str = "http://localhost:8000/v1",
+                 options: Optional[Dict[str, Any]] = None, api_key: str = "EMPTY"):
+        """
+        Args:
+            model: Model name as served (e.g. "google/gemma-3-1b-it")
+            temperature: Sampling temperature
+            base_url: Server URL including the /v1 prefix
+            options: Ollama-style options; num_predict is sent as max_tokens,
+                options without an OpenAI equivalent (num_ctx, ...) are ignored
+            api_key: Bearer token, if the server requires one
+        """
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.temperature = temperature
+        self.options = {"temperature": temperature, **(options or {})}
+        self._headers = {"Authorization": f"Bearer {api_key}"}
+        # Keep-alive connection pool shared by all threads using this instance.
+        # Long generations are fine, but a stuck server must not hang a worker forever.
+        self.client = httpx.Client(base_url=self.base_url, headers=self._headers,
+                                   timeout=httpx.Timeout(600, connect=10))
+
+    def warm_up(self) -> None:
+        """The server loads its model at startup; nothing to do."""
+
+    def close(self) -> None:
+        """Close the HTTP connection pool."""
+        self.client.close()
+
+    def _payload(self, messages: List[Dict[str, str]], format: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        payload = {"model": self.model, "messages": messages, "temperature": self.temperature}
+        if "num_predict" in self.options:
+            payload["max_tokens"] = self.options["num_predict"]
+        if format == "json":
+            payload["response_format"] = {"type": "json_object"}
+        elif format:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "response", "schema": format},
+            }
+        return payload
+
+    def invoke(self, messages: List[Dict[str, str]], format: Union[str, Dict[str, Any]] = "") -> str:
+        """format: "json" or a JSON schema to constrain the reply to (default: free text)."""
+        resp = self.client.post("/chat/completions", json=self._payload(messages, format))
+        resp.raise_for_status()
+        return resp.json()["choices"][0]["message"]["content"]
+
+
 # --- Your few-shot block (examples) ---
 few_shot_prompt = [
     ("user", "Who is the president of a given country X?"),
@@ -2,62 +2,194 @@
 
 from PIL import Image
 import base64
+import diskcache
+import hashlib
+import orjson
+import os
+from functools import lru_cache
 from io import BytesIO
 
-import ollama
+from chat import DEFAULT_BASE_URL, DEFAULT_KEEP_ALIVE, get_client, warm_up
+
+# Directory of the on-disk VLM reply cache
+VLM_CACHE_DIR = "./vlm_cache"
+
+
+def _fit_image(source, max_side):
+    """
+    Shrink an image so its longest side is at most max_side, re-encoded as JPEG.
+    
+    The VLM works on a few fixed-size tiles anyway, so extra pixels only add
+    upload and vision-encoder cost.
+    
+    Args:
+        source: Image file path, or the image bytes
+        max_side: Maximum length of the longest side, in pixels
+    
+    Returns:
+        The JPEG bytes, or None if the image is already within bounds (only its
+        header is read to find out, so the caller can use the original bytes).
+    """
+    # BytesIO shares an unmodified bytes object instead of copying it
+    with Image.open(BytesIO(source) if isinstance(source, bytes) else source) as img:
+        if max(img.size) <= max_side:
+            return None
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        buf = BytesIO()
+        img.convert("RGB").save(buf, "JPEG", quality=85)
+        return buf.getvalue()
+
+
+@lru_cache(maxsize=16)
+def _encode_file(image_path, mtime_ns, size, max_side):
+    """Read an image file and return it base64-encoded (cached per path/mtime/size)"""
+    fitted = _fit_image(image_path, max_side)
+    if fitted is not None:
+        return base64.b64encode(fitted).decode()
+    # Read straight into a buffer of the known size and encode from a view of it
+    buf = bytearray(size)
+    with open(image_path, "rb") as f:
+        n = f.readinto(buf)
+    return base64.b64encode(memoryview(buf)[:n]).decode()
+
 
 class MultimodalProcessor:
     """Extract and process non-text content from documents"""
     
-    def __init__(self, vlm_model="llava:7b-v1.5-q4_1"):
+    def __init__(self, vlm_model="llava:7b-v1.5-q4_1", base_url=DEFAULT_BASE_URL,
+                 keep_alive=DEFAULT_KEEP_ALIVE, num_predict=2048, num_ctx=4096,
+                 max_image_side=1344, cache_dir=VLM_CACHE_DIR):
+        """
+        Args:
+            vlm_model: Ollama vision-language model
+            base_url: Ollama server URL
+            keep_alive: How long the server keeps the model loaded
+            num_predict: Cap on generated tokens per image; a reply cut off by it
+                         is invalid JSON, so it leaves room for the whole
+                         2-3 paragraph description and entity summary
+            num_ctx: Context size; holds the image tokens, the prompt and the reply
+            max_image_side: Larger images are downscaled to this many pixels
+                            on their longest side (1344 = 4 x 336 llava tiles)
+            cache_dir: Directory of the image description cache (None disables it)
+        """
         self.vlm_model = vlm_model
+        self.num_predict = num_predict
+        self.num_ctx = num_ctx
+        self.max_image_side = max_image_side
+        self.base_url = base_url
+        self.keep_alive = keep_alive
+        self.client = get_client(base_url)
+        # Same image + context + model -> same description; a hit skips the VLM call
+        self.cache = diskcache.Cache(cache_dir) if cache_dir else None
+    
+    def warm_up(self):
+        """Load the VLM on the server before the first image arrives"""
+        warm_up(self.vlm_model, self.base_url, self.keep_alive)
     
     def extract_image_info(self, image_path, surrounding_context):
         """
-        Generate two representations for an image:
+        Generate two representations for an image in a single VLM call:
         1. Detailed description (for retrieval)
         2. Entity summary (for graph construction)
         """
-        # Encode image for VLM
-        with open(image_path, "rb") as f:
-            image_b64 = base64.b64encode(f.read()).decode()
-        
-        # Prompt 1: Detailed description
-        detail_prompt = f"""Analyze this image in detail, considering the surrounding context.
+        image_b64 = self._encode_image(image_path)
+        prompt = self._image_prompt(surrounding_context)
+        key = self._cache_key(image_b64, prompt, "json")
+        info = self._cached_info(key)
+        if info is None:
+            response = self._call_vlm(image_b64, prompt, format="json")
+            info = self._parse_image_response(response)
+            self._cache_info(key, info)
+        return self._with_image_path(info, image_path)
+    
+    def _encode_image(self, image_path):
+        """Return the image base64-encoded, reusing the cached encoding while the file is unchanged"""
+        if isinstance(image_path, dict):
+            # In-memory image from PDFParser(encode_inline=True), already encoded
+            fitted = _fit_image(base64.b64decode(image_path["b64"]), self.max_image_side)
+            return image_path["b64"] if fitted is None else base64.b64encode(fitted).decode()
+        stat = os.stat(image_path)
+        return _encode_file(os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size,
+                            self.max_image_side)
+    
+    @staticmethod
+    def _image_prompt(surrounding_context):
+        """Single prompt asking for both the description and the entity summary"""
+        return f"""Analyze this image in detail, considering the surrounding context,
+        and extract key entities for a knowledge graph.
 
         Context from document: {surrounding_context}
 
-        Provide a comprehensive description including:
+        The detailed description should be 2-3 paragraphs including:
         - Main objects and their relationships
         - Visual elements (charts, diagrams, etc.)
         - How this image relates to the surrounding text
         - Any technical details or data shown
 
-        Respond in 2-3 paragraphs."""
-
-        detailed_desc = self._call_vlm(image_b64, detail_prompt)
-        
-        # Prompt 2: Entity summary for graph
-        entity_prompt = f"""Based on this image, extract key entities for a knowledge graph.
-
-        Context: {surrounding_context}
-        detailed description: {detailed_desc}   
-
         Output JSON format:
         {{
-        "entity_name": "Figure_X_Title",
-        "entity_type": "image",
-        "key_entities": ["entity1", "entity2"]
+        "detailed_description": "...",
+        "entity_summary": {{
+            "entity_name": "Figure_X_Title",
+            "entity_type": "image",
+            "key_entities": ["entity1", "entity2"]
+        }}
         }}"""
-        
-        entity_summary = self._call_vlm(image_b64, entity_prompt)
+    
+    @staticmethod
+    def _parse_image_response(response):
+        """Split the combined VLM JSON answer into description and entity summary"""
+        # The request is decoded with format="json", so the answer is bare JSON
+        try:
+            data = orjson.loads(response)
+            detailed_desc = str(data["detailed_description"])
+            entity_summary = orjson.dumps(data.get("entity_summary", {})).decode()
+        except (orjson.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Unexpected VLM reply ({e!r}): {response!r}") from e
         
         return {
             "detailed_description": detailed_desc,
-            "entity_summary": entity_summary,
-            "image_path": image_path
+            "entity_summary": entity_summary
         }
     
+    @staticmethod
+    def _with_image_path(info, image_path):
+        """Image info dict for image_path (an inline image is reported by its name)"""
+        if isinstance(image_path, dict):
+            image_path = image_path["name"]
+        return {**info, "image_path": image_path}
+    
+    def _cache_key(self, image_b64, prompt, format):
+        """
+        sha256 over length-prefixed image, rendered prompt, format, model and generation options
+        
+        The full prompt (not just the context) is hashed, so editing the prompt
+        never returns a description produced for the old one.
+        """
+        digest = hashlib.sha256()
+        for part in (image_b64, prompt, format, self.vlm_model, str(self.num_predict), str(self.num_ctx)):
+            data = part.encode()
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+        return digest.hexdigest()
+    
+    def _cached_info(self, key):
+        """Return the cached image info, or None if missing or no longer valid"""
+        if self.cache is None:
+            return None
+        info = self.cache.get(key)
+        if info is None:
+            return None
+        try:
+            orjson.loads(info["entity_summary"])
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            return None
+        return info
+    
+    def _cache_info(self, key, info):
+        if self.cache is not None:
+            self.cache.set(key, info)
+    
     def extract_table_info(self, table_data, surrounding_context):
         """Extract structured info from tables"""
         # Convert table to text representation
@@ -79,17 +211,25 @@ class MultimodalProcessor:
         # Use regular LLM for tables
         return self._call_llm(prompt)
     
-    def _call_vlm(self, image_b64, prompt):
+    def _call_vlm(self, image_b64, prompt, format=""):
         """Call vision-language model"""
-        response = ollama.chat(
-            model=self.vlm_model,
-            messages=[{
+        response = self.client.chat(**self._vlm_request(image_b64, prompt, format))
+        return response['message']['content']
+    
+    def _vlm_request(self, image_b64, prompt, format=""):
+        """Keyword arguments for the VLM chat call"""
+        return {
+            'model': self.vlm_model,
+            'messages': [{
                 'role': 'user',
                 'content': prompt,
                 'images': [image_b64]
-            }]
-        )
-        return response['message']['content']
+            }],
+            # "json" makes the server constrain decoding to valid JSON
+            'format': format,
+            'options': {'num_ctx': self.num_ctx, 'num_predict': self.num_predict},
+            'keep_alive': self.keep_alive
+        }
     
 #Test
 def main():
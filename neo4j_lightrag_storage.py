@@ -4,12 +4,26 @@ Demonstrates how to store extracted entities and relationships in Neo4j
 and visualize them using free tools.
 """
 
-import json
+import csv
+import logging
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from neo4j import GraphDatabase
+from neo4j.exceptions import Neo4jError
 import matplotlib.pyplot as plt
 import networkx as nx
 from pyvis.network import Network
 
+logger = logging.getLogger(__name__)
+
+# Rows per UNWIND statement / transaction for the bulk_* methods
+BATCH_SIZE = 10000
+
+# Relationship loads smaller than this are written by a single thread
+PARALLEL_MIN_ROWS = 5000
+
 # ============================================================================
 # PART 1: NEO4J SETUP AND CONNECTION
 # ============================================================================
@@ -17,7 +31,8 @@ from pyvis.network import Network
 class Neo4jLightRAG:
     """Class to handle Neo4j operations for LightRAG knowledge graphs"""
     
-    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="passtest"):
+    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="passtest",
+                 max_connection_pool_size=32, ensure_schema=False):
         """
         Initialize Neo4j connection
         
@@ -25,8 +40,54 @@ class Neo4jLightRAG:
             uri: Neo4j database URI (default: local instance)
             user: Username (default: neo4j)
             password: Password you set during Neo4j installation
+            max_connection_pool_size: Connections shared by concurrent sessions
+            ensure_schema: Create the constraints and indexes the loaders rely on
+                (see create_schema); needs schema-admin rights, so read-only users
+                leave it off
         """
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        self.driver = GraphDatabase.driver(
+            uri, auth=(user, password),
+            max_connection_pool_size=max_connection_pool_size
+        )
+        if ensure_schema:
+            self.create_schema()
+    
+    def create_schema(self):
+        """
+        Create the schema that keeps MERGE/MATCH lookups index-backed
+        
+        Entity names are unique, so MERGE on (:Entity {name}) is a unique index
+        probe and concurrent writers cannot create the same entity twice.
+        Every statement is IF NOT EXISTS, so running this again is a no-op.
+        The schema syntax needs Neo4j 4.4 or later.
+        """
+        statements = [
+            "CREATE CONSTRAINT entity_name_unique IF NOT EXISTS "
+            "FOR (e:Entity) REQUIRE e.name IS UNIQUE",
+            "CREATE INDEX entity_type IF NOT EXISTS FOR (e:Entity) ON (e.type)",
+            "CREATE CONSTRAINT relationship_index_key IF NOT EXISTS "
+            "FOR (idx:RelationshipIndex) REQUIRE idx.key IS UNIQUE",
+            # search_by_theme filters with CONTAINS, which text indexes serve
+            "CREATE TEXT INDEX relationship_index_summary IF NOT EXISTS "
+            "FOR (idx:RelationshipIndex) ON (idx.summary)",
+        ]
+        with self.driver.session() as session:
+            for statement in statements:
+                try:
+                    session.run(statement).consume()
+                except Neo4jError as e:
+                    if e.code == "Neo.DatabaseError.Schema.ConstraintCreationFailed":
+                        raise RuntimeError(
+                            "Could not create a unique constraint: the database already holds "
+                            "duplicate values (for entities, list them with: MATCH (e:Entity) "
+                            "WITH e.name AS name, count(*) AS n WHERE n > 1 RETURN name, n). "
+                            f"Merge or delete the duplicates and retry. Server error: {e}"
+                        ) from e
+                    if e.code == "Neo.ClientError.Statement.SyntaxError":
+                        raise RuntimeError(
+                            f"Could not create the schema; it needs Neo4j 4.4 or later. Server error: {e}"
+                        ) from e
+                    raise
     
     def close(self):
         """Close the database connection"""
@@ -36,12 +97,15 @@ class Neo4jLightRAG:
         """Clear all nodes and relationships (use with caution!)"""
         with self.driver.session() as session:
             session.run("MATCH (n) DETACH DELETE n")
-            print("✅ Database cleared")
+            logger.info("✅ Database cleared")
     
     def create_entity(self, entity_name, entity_type, properties=None):
         """
         Create an entity node in Neo4j
         
+        All entities share the :Entity label and keep their type in the `type`
+        property, so the query text never changes and its plan stays cached.
+        
         Args:
             entity_name: Name of the entity
             entity_type: Type (Person, Organization, Technology, etc.)
@@ -51,17 +115,17 @@ class Neo4jLightRAG:
             if properties is None:
                 properties = {}
             
-            # Sanitize entity_type to ensure valid Neo4j label
+            # Sanitize entity_type so types match the ones written by load_lightrag_data
             sanitized_type = sanitize_label(entity_type)
             
-            # Create node with dynamic label based on entity_type
-            query = f"""
-            MERGE (e:{sanitized_type} {{name: $name}})
+            query = """
+            MERGE (e:Entity {name: $name})
+            ON CREATE SET e.type = $type
             SET e += $properties
             RETURN e
             """
-            session.run(query, name=entity_name, properties=properties)
-            print(f"✅ Created entity: {entity_name} ({entity_type})")
+            session.run(query, name=entity_name, type=sanitized_type, properties=properties)
+            logger.debug("✅ Created entity: %s (%s)", entity_name, entity_type)
     
     def create_relationship(self, source, target, relation_type, properties=None):
         """
@@ -78,18 +142,155 @@ class Neo4jLightRAG:
                 properties = {}
             
             # Use MERGE to avoid duplicates
+            escaped = relation_type.replace("`", "``")
             query = f"""
-            MATCH (s {{name: $source}})
-            MATCH (t {{name: $target}})
-            MERGE (s)-[r:{relation_type}]->(t)
+            MATCH (s:Entity {{name: $source}})
+            MATCH (t:Entity {{name: $target}})
+            MERGE (s)-[r:`{escaped}`]->(t)
             SET r += $properties
             RETURN r
             """
             result = session.run(query, source=source, target=target, properties=properties)
             if result.single():
-                print(f"✅ Created relationship: {source} -[{relation_type}]-> {target}")
+                logger.debug("✅ Created relationship: %s -[%s]-> %s", source, relation_type, target)
             else:
-                print(f"⚠️  Could not create relationship (entities may not exist)")
+                logger.warning("⚠️  Could not create relationship %s -[%s]-> %s (entities may not exist)",
+                               source, relation_type, target)
+    
+    def bulk_ingest(self, entities, relationships, batch_size=BATCH_SIZE):
+        """
+        Create many entities and relationships in one session and one transaction
+        
+        Args:
+            entities: List of {"name", "type", "properties" (optional)} dictionaries
+            relationships: List of {"source", "target", "relation",
+                           "properties" (optional)} dictionaries
+            batch_size: Number of rows sent per UNWIND statement
+        """
+        with self.driver.session() as session:
+            session.execute_write(
+                self._ingest_tx, entities, relationships, batch_size
+            )
+        logger.info("✅ Bulk ingested %d entities, %d relationships", len(entities), len(relationships))
+    
+    def bulk_create_entities(self, rows, batch_size=BATCH_SIZE):
+        """
+        Create many entities with batched UNWIND queries
+        
+        MERGE makes this idempotent; entities that already exist keep their type.
+        
+        Args:
+            rows: List of {"name", "type", "properties" (optional)} dictionaries
+            batch_size: Number of rows sent per transaction
+            
+        Returns:
+            int: Number of entities created
+        """
+        created = 0
+        with self.driver.session() as session:
+            for batch in _batched(rows, batch_size):
+                created += session.execute_write(self._merge_entities_tx, batch)
+        logger.debug("✅ Created %d entities (%d rows)", created, len(rows))
+        return created
+    
+    def bulk_create_relationships(self, rows, batch_size=BATCH_SIZE):
+        """
+        Create many relationships with batched UNWIND queries
+        
+        Args:
+            rows: List of {"source", "target", "relation", "properties" (optional)} dictionaries
+            batch_size: Number of rows sent per transaction
+            
+        Returns:
+            int: Number of relationships created
+        """
+        created = 0
+        with self.driver.session() as session:
+            for relation_type, group in _group_by_relation(rows).items():
+                for batch in _batched(group, batch_size):
+                    created += session.execute_write(
+                        self._merge_relationships_tx, relation_type, batch
+                    )
+        logger.debug("✅ Created %d relationships (%d rows)", created, len(rows))
+        return created
+    
+    @staticmethod
+    def _ingest_tx(tx, entities, relationships, batch_size):
+        """Transaction function for bulk_ingest: one UNWIND for entities, one per relationship type"""
+        for batch in _batched(entities, batch_size):
+            Neo4jLightRAG._merge_entities_tx(tx, batch)
+        
+        for relation_type, group in _group_by_relation(relationships).items():
+            for batch in _batched(group, batch_size):
+                Neo4jLightRAG._merge_relationships_tx(tx, relation_type, batch)
+    
+    @staticmethod
+    def _merge_entities_tx(tx, entities):
+        """MERGE a batch of entities with a single UNWIND statement"""
+        # Sent as parallel columns rather than one map per row, so the driver
+        # encodes flat lists of strings instead of repeating every key per entity.
+        # description and index_summary get their own columns; null leaves the
+        # stored value alone. Any other properties go in $extra, null for most rows.
+        query = """
+        UNWIND range(0, size($names) - 1) AS i
+        MERGE (e:Entity {name: $names[i]})
+        ON CREATE SET e.type = $types[i]
+        SET e.description = coalesce($descriptions[i], e.description),
+            e.index_summary = coalesce($summaries[i], e.index_summary)
+        SET e += coalesce($extra[i], {})
+        """
+        names, types, descriptions, summaries, extra = [], [], [], [], []
+        for entity in entities:
+            properties = dict(entity.get("properties") or {})
+            names.append(entity["name"])
+            types.append(sanitize_label(entity["type"]))
+            descriptions.append(properties.pop("description", None))
+            summaries.append(properties.pop("index_summary", None))
+            extra.append(properties or None)
+        result = tx.run(query, names=names, types=types, descriptions=descriptions,
+                        summaries=summaries, extra=extra)
+        return result.consume().counters.nodes_created
+    
+    @staticmethod
+    def _merge_relationships_tx(tx, relation_type, relationships):
+        """MERGE a batch of relationships of one type with a single UNWIND statement"""
+        # Relationship types cannot be query parameters, hence one statement per type.
+        # Backtick-quoted, so any character the LLM produced is a valid identifier
+        escaped = relation_type.replace("`", "``")
+        query = f"""
+        UNWIND $rows AS r
+        MATCH (s:Entity {{name: r.source}})
+        MATCH (t:Entity {{name: r.target}})
+        MERGE (s)-[rel:`{escaped}`]->(t)
+        SET rel += r.properties
+        """
+        rows = [
+            {"source": r["source"], "target": r["target"], "properties": r.get("properties") or {}}
+            for r in relationships
+        ]
+        return tx.run(query, rows=rows).consume().counters.relationships_created
+    
+    def bulk_add_entity_index(self, rows, batch_size=BATCH_SIZE):
+        """
+        Add many index summaries with batched UNWIND queries
+        
+        Args:
+            rows: List of {"name", "summary"} dictionaries
+            batch_size: Number of rows sent per transaction
+        """
+        with self.driver.session() as session:
+            for batch in _batched(rows, batch_size):
+                session.execute_write(self._set_index_summaries_tx, batch)
+        logger.debug("✅ Added %d index summaries", len(rows))
+    
+    @staticmethod
+    def _set_index_summaries_tx(tx, rows):
+        query = """
+        UNWIND $rows AS r
+        MATCH (e:Entity {name: r.name})
+        SET e.index_summary = r.summary
+        """
+        tx.run(query, rows=rows).consume()
     
     def add_entity_index(self, entity_name, summary):
         """
@@ -101,12 +302,12 @@ class Neo4jLightRAG:
         """
         with self.driver.session() as session:
             query = """
-            MATCH (e {name: $name})
+            MATCH (e:Entity {name: $name})
             SET e.index_summary = $summary
             RETURN e
             """
             session.run(query, name=entity_name, summary=summary)
-            print(f"✅ Added index summary to: {entity_name}")
+            logger.debug("✅ Added index summary to: %s", entity_name)
     
     def add_relationship_index(self, relation_key, relation_value):
         """
@@ -123,14 +324,14 @@ class Neo4jLightRAG:
             RETURN idx
             """
             session.run(query, key=relation_key, value=relation_value)
-            print(f"✅ Added relationship index: {relation_key}")
+            logger.debug("✅ Added relationship index: %s", relation_key)
     
     def query_entity(self, entity_name):
         """Retrieve an entity and its summary"""
         with self.driver.session() as session:
             query = """
-            MATCH (e {name: $name})
-            RETURN e.name as name, labels(e) as type, e.index_summary as summary
+            MATCH (e:Entity {name: $name})
+            RETURN e.name as name, e.type as type, e.index_summary as summary
             """
             result = session.run(query, name=entity_name)
             return result.single()
@@ -139,7 +340,7 @@ class Neo4jLightRAG:
         """Get all relationships for an entity"""
         with self.driver.session() as session:
             query = """
-            MATCH (e {name: $name})-[r]-(other)
+            MATCH (e:Entity {name: $name})-[r]-(other)
             RETURN e.name as entity, type(r) as relationship, other.name as connected_to
             """
             result = session.run(query, name=entity_name)
@@ -167,7 +368,7 @@ class Neo4jLightRAG:
             query = """
             MATCH (n)-[r]->(m)
             RETURN n.name as source, type(r) as relationship, m.name as target,
-                   labels(n) as source_type, labels(m) as target_type
+                   n.type as source_type, m.type as target_type
             """
             result = session.run(query)
             return [record.data() for record in result]
@@ -183,23 +384,105 @@ class Neo4jLightRAG:
         """
         with self.driver.session() as session:
             query = """
-                MATCH (n {name: $name})
-                RETURN count(n) > 0 as exists
+                MATCH (n:Entity {name: $name})
+                RETURN 1 LIMIT 1
             """
             result = session.run(query, name=entity_name)
-            record = result.single()
-            return record["exists"] if record else False
+            return result.single() is not None
+    
+    def entities_exist(self, entity_names):
+        """
+        Check several entity names in a single query
+        
+        Args:
+            entity_names: Names of the entities to check
+            
+        Returns:
+            dict: {name: True if the entity exists, False otherwise}
+        """
+        with self.driver.session() as session:
+            query = """
+                UNWIND $names AS name
+                OPTIONAL MATCH (n:Entity {name: name})
+                RETURN DISTINCT name, n IS NOT NULL as exists
+            """
+            result = session.run(query, names=list(entity_names))
+            return {record["name"]: record["exists"] for record in result}
+    
+    def entity_names(self):
+        """
+        Get the names of all entities in the database
+        
+        Returns:
+            set: Entity names
+        """
+        with self.driver.session() as session:
+            result = session.run("MATCH (e:Entity) RETURN e.name AS name")
+            return {record["name"] for record in result}
 
 # ============================================================================
 # PART 2: LOAD YOUR EXTRACTED DATA INTO NEO4J
 # ============================================================================
+def _group_by(rows, key):
+    """Group rows into a {key(row): [rows]} dictionary, keeping their order"""
+    groups = {}
+    for row in rows:
+        groups.setdefault(key(row), []).append(row)
+    return groups
+
+def _batched(rows, size):
+    """Yield consecutive slices of at most `size` rows"""
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+# Spaces and hyphens become underscores
+_LABEL_TRANS = str.maketrans({' ': '_', '-': '_'})
+
+@lru_cache(maxsize=100_000)
 def sanitize_label(label):
     """Convert a label to a valid Neo4j label format"""
-    # Replace spaces and special characters with underscores
-    return label.replace(' ', '_').replace('-', '_')
+    # Single pass over the string; names repeat a lot across chunks, hence the cache
+    return label.translate(_LABEL_TRANS)
+
+@lru_cache(maxsize=10_000)
+def normalize_relation(relation):
+    """Normalize an extracted relation ("is part of") to a relationship type ("IS_PART_OF"), or None if empty"""
+    return sanitize_label(relation.strip()).upper() or None
+
+def _group_by_relation(rows):
+    """
+    Group relationship rows by normalized type, skipping rows without a usable one
+    
+    One unusable row must not fail the statement (and transaction) of every other row.
+    """
+    groups = {}
+    skipped = 0
+    for row in rows:
+        rel_type = normalize_relation(row["relation"]) if isinstance(row.get("relation"), str) else None
+        if rel_type is None:
+            skipped += 1
+            continue
+        groups.setdefault(rel_type, []).append(row)
+    if skipped:
+        logger.warning("⚠️ Skipped %d relationships without a relation type", skipped)
+    return groups
+
+def _create_relationships_parallel(neo4j_handler, rows, workers):
+    """
+    Write relationships from several threads, each with its own session
+    
+    Rows are sharded by source node so one node's relationships are written
+    by one thread; managed transactions retry deadlocks between shards.
+    """
+    if workers <= 1 or len(rows) < PARALLEL_MIN_ROWS:
+        return neo4j_handler.bulk_create_relationships(rows)
+    
+    shards = _group_by(rows, lambda r: hash(r["source"]) % workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(neo4j_handler.bulk_create_relationships, shards.values()))
 
 def load_lightrag_data(neo4j_handler, entities_json, relationships_json, 
-                       entity_index_json):
+                       entity_index_json, workers=4):
     """
     Load all extracted LightRAG data into Neo4j
     
@@ -208,40 +491,36 @@ def load_lightrag_data(neo4j_handler, entities_json, relationships_json,
         entities_json: List of entity dictionaries
         relationships_json: List of relationship dictionaries
         entity_index_json: List of entity index key-value pairs
+        workers: Threads used to write large relationship loads
     """
-    print("\n" + "="*60)
-    print("LOADING DATA INTO NEO4J")
-    print("="*60 + "\n")
-    
-    # Step 1: Create all entities
-    print("📥 Creating entities...")
-    for entity in entities_json:
-        entity_name = sanitize_label(entity["name"])
-        entity_type = sanitize_label(entity["type"])
-        if neo4j_handler.entity_exists(entity_name):
-            print(f"⏭️  Entity already exists: {entity_name} ({entity_type})")
-        else:
-            neo4j_handler.create_entity(
-                entity_name=entity_name,
-                entity_type=entity_type
-            )
+    # Step 1: Create all entities (MERGE leaves existing ones untouched).
+    # Single-threaded so concurrent writers never race to create the same node.
+    # Sanitize each entity name once; relationships and index entries look it up
+    name_map = {entity["name"]: sanitize_label(entity["name"]) for entity in entities_json}
+    
+    def safe_name(name):
+        return name_map[name] if name in name_map else sanitize_label(name)
+    
+    entities_created = neo4j_handler.bulk_create_entities([
+        {"name": name_map[entity["name"]], "type": sanitize_label(entity["type"])}
+        for entity in entities_json
+    ])
 
     # Step 2: Create all relationships
-    print("\n📥 Creating relationships...")
-    for rel in relationships_json:
-        neo4j_handler.create_relationship(
-            source=sanitize_label(rel["source"]),
-            target=sanitize_label(rel["target"]),
-            relation_type=rel["relation"].upper()  # Neo4j convention: uppercase
-        )
+    relationships_created = _create_relationships_parallel(neo4j_handler, [
+        {
+            "source": safe_name(rel["source"]),
+            "target": safe_name(rel["target"]),
+            "relation": rel["relation"]  # Normalized to a relationship type when grouped
+        }
+        for rel in relationships_json
+    ], workers)
     
     # Step 3: Add entity index summaries
-    print("\n📥 Adding entity index summaries...")
-    for idx in entity_index_json:
-        neo4j_handler.add_entity_index(
-            entity_name=sanitize_label(idx["key"]),
-            summary=idx["value"]
-        )
+    neo4j_handler.bulk_add_entity_index([
+        {"name": safe_name(idx["key"]), "summary": idx["value"]}
+        for idx in entity_index_json
+    ])
     
     # Step 4: Add relationship index (theme-based search)
     # print("\n📥 Adding relationship indexes...")
@@ -251,11 +530,73 @@ def load_lightrag_data(neo4j_handler, entities_json, relationships_json,
     #         relation_value=idx["value"]
     #     )
     
-    print("\n✅ All data loaded successfully!")
+    # One summary line per load instead of a line per step
+    logger.info(
+        "✅ Loaded into Neo4j: entities created=%d skipped=%d, relationships created=%d, index summaries=%d",
+        entities_created, len(entities_json) - entities_created,
+        relationships_created, len(entity_index_json)
+    )
+
+def load_lightrag_data_csv(entities_json, relationships_json, entity_index_json,
+                           import_dir="neo4j_import", database="neo4j",
+                           neo4j_admin="neo4j-admin"):
+    """
+    Initial bulk load through `neo4j-admin database import full`
+    
+    Much faster than Bolt MERGEs for a first load, but the target database
+    must be stopped and empty. Use load_lightrag_data for later updates.
+    
+    Args:
+        entities_json: List of entity dictionaries
+        relationships_json: List of relationship dictionaries
+        entity_index_json: List of entity index key-value pairs
+        import_dir: Directory where the CSV files are written
+        database: Name of the database to create
+        neo4j_admin: Path to the neo4j-admin executable
+    """
+    os.makedirs(import_dir, exist_ok=True)
+    entities_csv = os.path.join(import_dir, "entities.csv")
+    relationships_csv = os.path.join(import_dir, "relationships.csv")
+    
+    # Same node semantics as the MERGE path: one node per name, first type wins
+    summaries = {sanitize_label(idx["key"]): idx["value"] for idx in entity_index_json}
+    with open(entities_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name:ID", "type", "index_summary"])
+        seen = set()
+        for entity in entities_json:
+            name = sanitize_label(entity["name"])
+            if name not in seen:
+                seen.add(name)
+                writer.writerow([name, sanitize_label(entity["type"]), summaries.get(name, "")])
+    
+    with open(relationships_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([":START_ID", ":END_ID", ":TYPE"])
+        seen = set()
+        for rel in relationships_json:
+            rel_type = normalize_relation(rel["relation"])
+            if rel_type is None:
+                continue
+            row = (sanitize_label(rel["source"]), sanitize_label(rel["target"]), rel_type)
+            if row not in seen:
+                seen.add(row)
+                writer.writerow(row)
+    
+    # Relationships to unknown entities are skipped, as the MATCH-based path does
+    subprocess.run([
+        neo4j_admin, "database", "import", "full",
+        f"--nodes=Entity={entities_csv}",
+        f"--relationships={relationships_csv}",
+        "--skip-bad-relationships",
+        database,
+    ], check=True)
+    logger.info("✅ Imported %s into database %s", import_dir, database)
 
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     
     # Sample data (replace with your actual extracted data)
     entities = [
@@ -308,7 +649,8 @@ if __name__ == "__main__":
     neo4j = Neo4jLightRAG(
         uri="bolt://localhost:7687",
         user="neo4j",
-        password="passtest"  # CHANGE THIS!
+        password="passtest",  # CHANGE THIS!
+        ensure_schema=True
     )
     
     try:
@@ -316,8 +658,9 @@ if __name__ == "__main__":
         # neo4j.clear_database()
         
         # Load all data
-        load_lightrag_data(neo4j, entities, relationships, 
-                          entity_index, relationship_index)
+        load_lightrag_data(neo4j, entities, relationships, entity_index)
+        for idx in relationship_index:
+            neo4j.add_relationship_index(relation_key=idx["key"], relation_value=idx["value"])
         
         # Example queries
         print("\n" + "="*60)
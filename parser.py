@@ -4,85 +4,225 @@ Extracts text (chunked by paragraphs) and images (saved as PNGs).
 """
 
 import os
+import base64
+import hashlib
+import multiprocessing
 import fitz  # PyMuPDF
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import List, Dict, Any, Generator
+from typing import List, Deque, Dict, Any, Generator, Iterable, Iterator, Optional, Set, Tuple
+
+# A page block in reading order: ("text", text, None, None) or
+# ("image", sha1 of the image bytes, image_ext, image_bytes). image_ext/image_bytes
+# are None for an image this worker already returned for an earlier page.
+PageBlock = Tuple[str, str, Optional[str], Optional[bytes]]
+# Page extraction result: (page_num, blocks)
+PageResult = Tuple[int, List[PageBlock]]
+
+# Documents with fewer pages are extracted in-process: starting the workers
+# and reopening the PDF in each costs more than it saves on short documents
+PARALLEL_MIN_PAGES = 16
+
+# Document handle and digests of returned images, kept once per pool worker (see _init_worker)
+_worker_doc = None
+_worker_seen_images: Set[str] = set()
+
+
+def _init_worker(pdf_path: str) -> None:
+    """Open the PDF once in each worker process instead of once per page."""
+    global _worker_doc, _worker_seen_images
+    _worker_doc = fitz.open(pdf_path)
+    _worker_seen_images = set()
+
+
+def _extract_page(doc, page_num: int, seen_images: Set[str]) -> PageResult:
+    """
+    Extract the text blocks and images of a single page, in reading order.
+
+    Text and images come from one get_text("dict") pass over the page.
+
+    Args:
+        doc: Open fitz.Document.
+        page_num: Zero-based page index.
+        seen_images: Digests of images already returned for this document; their
+            bytes are not returned again (e.g. a logo repeated on every page).
+
+    Returns:
+        Tuple of (page_num, blocks).
+    """
+    page = doc.load_page(page_num)
+
+    blocks: List[PageBlock] = []
+    for block in page.get_text("dict", sort=True)["blocks"]:
+        if block["type"] == 0: # Text
+            text = "\n".join(
+                "".join(span["text"] for span in line["spans"]) for line in block["lines"]
+            ).strip()
+            if text:
+                blocks.append(("text", text, None, None))
+
+        elif block["type"] == 1: # Image
+            image_bytes = block["image"]
+            digest = hashlib.sha1(image_bytes).hexdigest()
+            if digest in seen_images:
+                blocks.append(("image", digest, None, None))
+            else:
+                seen_images.add(digest)
+                blocks.append(("image", digest, block["ext"], image_bytes))
+
+    # Let MuPDF release the page before the next one is loaded
+    del page
+    return page_num, blocks
+
+
+def _extract_page_in_worker(page_num: int) -> PageResult:
+    return _extract_page(_worker_doc, page_num, _worker_seen_images)
+
+
+def _map_bounded(pool: ProcessPoolExecutor, fn, items: Iterable[int], window: int) -> Iterator[PageResult]:
+    """
+    Like pool.map, but with at most `window` pages submitted ahead of the consumer,
+    so a slow consumer does not make every page's results pile up in memory.
+    """
+    pending: Deque[Future] = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
 
 class PDFParser:
     """
     Parses PDF files, extracting text chunks and images.
     """
 
-    def __init__(self, output_dir: str = "parsed_content"):
+    def __init__(self, output_dir: str = "parsed_content", n_workers: Optional[int] = None,
+                 encode_inline: bool = False):
+        """
+        Args:
+            output_dir: Directory where extracted images are written.
+            n_workers: Number of processes used to extract pages
+                (default: os.cpu_count(); 1 extracts in-process).
+            encode_inline: Keep images in memory instead of writing them to disk;
+                image chunk content is then {"name": filename, "b64": base64 data},
+                which MultimodalProcessor accepts directly.
+        """
         self.output_dir = Path(output_dir)
         self.images_dir = self.output_dir / "images"
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.images_dir.mkdir(parents=True, exist_ok=True)
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.encode_inline = encode_inline
 
     def parse_pdf(self, pdf_path: str) -> Generator[Dict[str, Any], None, None]:
         """
         Parse a PDF file and yield chunks (text or image).
-        
+
+        Pages of documents with at least PARALLEL_MIN_PAGES pages are extracted
+        in parallel worker processes; chunks are still yielded in page order.
+
         Args:
             pdf_path: Path to the PDF file.
-            
+
         Yields:
             Dictionary containing chunk data.
         """
         doc = fitz.open(pdf_path)
+        num_pages = doc.page_count
+
+        if self.n_workers > 1 and num_pages >= PARALLEL_MIN_PAGES:
+            doc.close()
+            n_workers = min(self.n_workers, num_pages)
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                # Callers parse from a thread while others are running (see
+                # pipeline.process_pdf_document); forking then can deadlock the child
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(pdf_path,),
+            ) as pool:
+                # Results come back in page order. Pages are handed to workers
+                # in order too, so a worker only leaves out the bytes of an image
+                # it returned for an earlier page, which _assemble_chunks has already seen.
+                yield from self._assemble_chunks(
+                    _map_bounded(pool, _extract_page_in_worker, range(num_pages), 2 * n_workers)
+                )
+        else:
+            seen_images: Set[str] = set()
+            try:
+                yield from self._assemble_chunks(
+                    _extract_page(doc, page_num, seen_images) for page_num in range(num_pages)
+                )
+            finally:
+                doc.close()
+
+    def _assemble_chunks(self, pages: Iterable[PageResult]) -> Generator[Dict[str, Any], None, None]:
+        """Turn ordered page results into chunks, saving images to disk unless encode_inline."""
         last_text_content = ""
-        
-        for page_num, page in enumerate(doc):
-            # 1. Extract Text (Paragraphs)
-            blocks = page.get_text("blocks")
-            # blocks structure: (x0, y0, x1, y1, "lines in block", block_no, block_type)
-            
-            for block in blocks:
-                block_type = block[6]
-                
-                if block_type == 0: # Text
-                    text = block[4].strip()
-                    if text:
+        # Each image is emitted once, on the first page that shows it
+        seen_images: Set[str] = set()
+        writes: List[Future] = []
+        # Image files are written in the background while the consumer handles earlier chunks
+        io_pool = ThreadPoolExecutor(max_workers=4)
+
+        try:
+            for page_num, blocks in pages:
+                # Start this page's image writes first so they overlap with the earlier chunks
+                images: Dict[str, Tuple[Any, Optional[Future]]] = {}
+                for kind, digest, image_ext, image_bytes in blocks:
+                    if kind != "image" or digest in seen_images:
+                        continue
+                    seen_images.add(digest)
+                    # Only a worker that returned this image before omits its bytes,
+                    # and then this assembler has seen it already
+                    assert image_bytes is not None
+                    images[digest] = self._store_image(
+                        f"page_{page_num + 1}_img_{len(images) + 1}.{image_ext}", image_bytes,
+                        io_pool, writes
+                    )
+
+                for kind, value, _, _ in blocks:
+                    if kind == "text":
                         chunk = {
                             "type": "text",
-                            "content": text,
+                            "content": value,
                             "page": page_num + 1,
                             "context": "" # Text chunks don't strictly need context from previous, but could have it
                         }
-                        last_text_content = text # Update context for subsequent images
+                        last_text_content = value # Update context for subsequent images
+                        yield chunk
+
+                    elif value in images:
+                        content, write = images.pop(value)
+                        if write is not None:
+                            # The consumer may open the file as soon as it gets the chunk
+                            write.result()
+                        chunk = {
+                            "type": "image",
+                            "content": content,
+                            "page": page_num + 1,
+                            "context": last_text_content # Context from the text immediately preceding
+                        }
                         yield chunk
-                        
-                elif block_type == 1: # Image
-                    # Note: get_text("blocks") might not give full image control, 
-                    # so we iterate over images separately or handle them here if possible.
-                    # Better approach for images in PyMuPDF is get_images() or iterating drawing commands.
-                    # However, blocks with type 1 are images.
-                    pass
-
-            # 2. Extract Images (Robust method)
-            image_list = page.get_images(full=True)
-            
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-                
-                image_filename = f"page_{page_num + 1}_img_{img_index + 1}.{image_ext}"
-                image_path = self.images_dir / image_filename
-                
-                with open(image_path, "wb") as f:
-                    f.write(image_bytes)
-                
-                chunk = {
-                    "type": "image",
-                    "content": str(image_path.absolute()),
-                    "page": page_num + 1,
-                    "context": last_text_content # Context from the text immediately preceding
-                }
-                yield chunk
-
-        doc.close()
+        finally:
+            # Every image file is on disk once parsing finishes
+            wait(writes)
+            io_pool.shutdown()
+
+    def _store_image(self, image_filename: str, image_bytes: bytes, io_pool: ThreadPoolExecutor,
+                     writes: List[Future]) -> Tuple[Any, Optional[Future]]:
+        """Return (chunk content, pending file write) for an extracted image."""
+        if self.encode_inline:
+            # Encoded once here; no disk write and read-back before the VLM call
+            return {"name": image_filename, "b64": base64.b64encode(image_bytes).decode()}, None
+
+        image_path = self.images_dir / image_filename
+        write = io_pool.submit(image_path.write_bytes, image_bytes)
+        writes.append(write)
+        return str(image_path.absolute()), write
 
 if __name__ == "__main__":
     # Simple test
@@ -97,4 +237,4 @@ if __name__ == "__main__":
             else:
                 print(f"File: {chunk['content']}")
                 print(f"Context: {chunk['context'][:50]}...")
-            print("-" * 20)
\ No newline at end of file
+            print("-" * 20)
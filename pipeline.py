@@ -11,11 +11,94 @@ Architecture:
 5. Indexing: Create searchable key-value index for entities
 """
 
-import json
-from typing import Dict, List, Tuple, Any
+import argparse
+import hashlib
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import diskcache
+import orjson
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 import ollama
-from chat import PromptTemplate, ChatOllamaMini
-from neo4j_lightrag_storage import load_lightrag_data, Neo4jLightRAG
+from chat import PromptTemplate, ChatOllamaMini, ChatOpenAICompat
+from neo4j_lightrag_storage import load_lightrag_data, Neo4jLightRAG, sanitize_label
+
+logger = logging.getLogger(__name__)
+
+# 4-bit build of the extraction model (the weights Ollama's gemma3:1b tag points to),
+# named explicitly so the quantization does not change if that tag is re-pointed
+DEFAULT_MODEL = "gemma3:1b-it-q4_K_M"
+
+# Context and output caps for extraction calls. The combined reply holds the
+# triples plus a 2-3 sentence summary per entity; for a dense TEXT_BATCH_CHARS
+# batch (~20 entities) that is well over 1k tokens, and a reply cut off by
+# num_predict is invalid JSON, losing the whole batch. The prompt and batch
+# are ~1.5k tokens, so 8192 holds them plus the full reply without
+# allocating the model's full context.
+EXTRACTION_OPTIONS = {"num_ctx": 8192, "num_predict": 3072}
+
+# On-disk cache of extraction replies, reused when the same prompt is sent again
+EXTRACTION_CACHE_DIR = ".extraction_cache"
+
+# Append-only archive of the raw extraction results
+ARCHIVE_PATH = "knowledge_graph_data.jsonl"
+
+# The archive is fsynced after this many records (and on close), bounding
+# what a crash can lose without a sync per chunk
+ARCHIVE_FSYNC_EVERY = 64
+
+# JSON schemas the extraction replies are constrained to, so they are always
+# parseable JSON (no code fences, no truncated objects from free-form output)
+TRIPLES_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "entities": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"name": {"type": "string"}, "type": {"type": "string"}},
+                "required": ["name", "type"],
+            },
+        },
+        "relationships": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "source": {"type": "string"},
+                    "relation": {"type": "string"},
+                    "target": {"type": "string"},
+                },
+                "required": ["source", "relation", "target"],
+            },
+        },
+    },
+    "required": ["entities", "relationships"],
+}
+
+INDEX_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "entity_index": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"key": {"type": "string"}, "value": {"type": "string"}},
+                "required": ["key", "value"],
+            },
+        },
+    },
+    "required": ["entity_index"],
+}
+
+# Single-call extraction: triples and entity index in one object
+COMBINED_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {**TRIPLES_SCHEMA["properties"], **INDEX_SCHEMA["properties"]},
+    "required": TRIPLES_SCHEMA["required"] + INDEX_SCHEMA["required"],
+}
 
 
 class PromptTemplates:
@@ -31,44 +114,11 @@ class PromptTemplates:
         """
         return PromptTemplate.from_messages([
             ("system",
-             """You are an expert knowledge graph builder. Extract entities and relationships from text.
-
-**ENTITIES** are concrete things (nouns):
-- People: Dr. Sarah Chen, Dr. Michael Torres
-- Organizations: Stanford Medical Center, MIT, National Heart Institute  
-- Medical Conditions: Heart Disease, Arrhythmias
-- Technologies: AI, Machine Learning Models
-- Concepts: Research, Diagnostic Tools
-
-**RELATIONSHIPS** connect two entities with action verbs:
-- works_at, specializes_in, researches, collaborates_with, develops, funds, diagnoses, detects
-
-**RULES:**
-1. Extract only entities explicitly mentioned in the text
-2. Do NOT extract properties (like "cardiologist" or "95%") as separate entities
-3. Ensure relationship direction is correct (who does what to whom)
-4. Output as JSON array of triples
-**ADDITIONAL RULES:**
-- DO NOT extract percentages, numbers, or statistics as entities
-- Ensure relationship directions are correct (check who does what to whom)
-- Include funding organizations explicitly mentioned
-- Extract all people and organizations mentioned by name
-
-**EXAMPLE OUTPUT FORMAT:**
-```json
-{
-  "entities": [
-    {"name": "Dr. Sarah Chen", "type": "Person"},
-    {"name": "Stanford Medical Center", "type": "Organization"}
-  ],
-  "relationships": [
-    {"source": "Dr. Sarah Chen", "relation": "works_at", "target": "Stanford Medical Center"},
-    {"source": "Dr. Sarah Chen", "relation": "specializes_in", "target": "Heart Disease"}
-  ]
-}
-```
-
-Extract entities and relationships from the following text."""),
+             """You are an expert knowledge graph builder. Extract entities and relationships from the text.
+- Entities: people, organizations, conditions, technologies and concepts explicitly named in the text (nouns). Type examples: Person, Organization, MedicalCondition, Technology, Concept.
+- Never extract properties, numbers, percentages or statistics as entities.
+- Relationships: source -relation-> target between extracted entities; relation is a snake_case verb (works_at, researches, funds, ...). Check the direction: who does what to whom.
+- Include every person, organization and funder mentioned by name."""),
             ("user", "{text}"),          
         ])
     
@@ -115,13 +165,76 @@ For each entity, generate key-value pairs:
 Generate the key-value index from the provided entities, relationships, and original text."""),
             ("user", "Entities and Relationships:{question} Original Text:{text}"), 
         ])
+    
+    @staticmethod
+    def get_combined_extraction_prompt() -> PromptTemplate:
+        """
+        Prompt for extracting entities, relationships and the entity index in one call.
+        
+        The text is read once instead of twice (extraction, then index generation).
+        """
+        return PromptTemplate.from_messages([
+            ("system",
+             """You are an expert knowledge graph builder. Extract entities, relationships and an entity index from the text.
+- Entities: people, organizations, conditions, technologies and concepts explicitly named in the text (nouns). Type examples: Person, Organization, MedicalCondition, Technology, Concept.
+- Never extract properties, numbers, percentages or statistics as entities.
+- Relationships: source -relation-> target between extracted entities; relation is a snake_case verb (works_at, researches, funds, ...). Check the direction: who does what to whom.
+- Include every person, organization and funder mentioned by name.
+- entity_index: one entry per entity; key is its name, value a 2-3 sentence summary of what it is and its facts and relations, using only the text."""),
+            ("user", "{text}"),
+        ])
+
+
+class ExtractionCache:
+    """
+    Exact-match cache of LLM replies, stored on disk so it survives reruns.
+    
+    The key covers everything that determines the reply: model, options,
+    output schema and the fully rendered messages. Editing a prompt or
+    changing the model therefore never returns a stale reply.
+    """
+    
+    def __init__(self, directory: str = EXTRACTION_CACHE_DIR):
+        self._cache = diskcache.Cache(directory)
+    
+    @staticmethod
+    def key(llm: Union[ChatOllamaMini, ChatOpenAICompat], messages: List[Dict[str, str]], schema: Dict) -> str:
+        """sha256 over length-prefixed parts, so no two part lists share a key."""
+        digest = hashlib.sha256()
+        for part in (llm.model, llm.options, schema, messages):
+            data = orjson.dumps(part, option=orjson.OPT_SORT_KEYS) if not isinstance(part, str) else part.encode()
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+        return digest.hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached reply, or None if missing or no longer valid JSON."""
+        reply = self._cache.get(key)
+        if reply is None:
+            return None
+        try:
+            orjson.loads(reply)
+        except orjson.JSONDecodeError:
+            return None
+        return reply
+    
+    def set(self, key: str, reply: str) -> None:
+        """Store a reply; replies that are not valid JSON are not cached."""
+        try:
+            orjson.loads(reply)
+        except orjson.JSONDecodeError:
+            return
+        self._cache.set(key, reply)
 
 
 class KnowledgeGraphExtractor:
     """Handles LLM-based extraction of entities and relationships from text"""
     
-    def __init__(self, model: str = "gemma3:1b", temperature: float = 0.0, 
-                 base_url: str = "http://localhost:11434"):
+    def __init__(self, model: str = DEFAULT_MODEL, temperature: float = 0.0, 
+                 base_url: str = "http://localhost:11434", keep_alive: Union[str, float] = -1,
+                 cache_dir: Optional[str] = EXTRACTION_CACHE_DIR, legacy: bool = False,
+                 backend: str = "ollama",
+                 index_llm: Optional[Union[ChatOllamaMini, ChatOpenAICompat]] = None):
         """
         Initialize the extractor with LLM configuration.
         
@@ -129,10 +242,53 @@ class KnowledgeGraphExtractor:
             model: Ollama model name to use
             temperature: LLM temperature (0.0 for deterministic)
             base_url: Ollama server URL
+            keep_alive: How long Ollama keeps the model loaded between calls
+                (-1: until the server stops, so it is never reloaded mid-document)
+            cache_dir: Directory of the extraction reply cache (None disables it)
+            legacy: Use two LLM calls per text (extraction, then index generation)
+                instead of the single combined call
+            backend: "ollama", or "openai" for an OpenAI-compatible server such as
+                vLLM (base_url then points at its /v1 endpoint)
+            index_llm: Separate LLM for generate_entity_index, e.g. a server running
+                speculative decoding with a draft model. Only used when legacy=True;
+                the default combined call writes the index in the same reply
         """
-        self.llm = ChatOllamaMini(model=model, temperature=temperature, base_url=base_url)
+        self.llm: Union[ChatOllamaMini, ChatOpenAICompat]
+        if backend == "openai":
+            self.llm = ChatOpenAICompat(model=model, temperature=temperature, base_url=base_url,
+                                        options=EXTRACTION_OPTIONS)
+        elif backend == "ollama":
+            self.llm = ChatOllamaMini(model=model, temperature=temperature, base_url=base_url,
+                                      keep_alive=keep_alive, options=EXTRACTION_OPTIONS)
+        else:
+            raise ValueError(f"Unknown LLM backend: {backend}")
+        if index_llm is not None and not legacy:
+            logger.warning("⚠️ index_llm is ignored unless legacy=True")
+        self.index_llm = index_llm or self.llm
         self.entity_prompt = PromptTemplates.get_entity_extraction_prompt()
         self.index_prompt = PromptTemplates.get_index_generation_prompt()
+        self.combined_prompt = PromptTemplates.get_combined_extraction_prompt()
+        self.legacy = legacy
+        self.cache = ExtractionCache(cache_dir) if cache_dir else None
+    
+    def close(self) -> None:
+        """Close the LLM clients."""
+        self.llm.close()
+        if self.index_llm is not self.llm:
+            self.index_llm.close()
+    
+    def _invoke(self, messages: List[Dict[str, str]], schema: Dict,
+                llm: Optional[Union[ChatOllamaMini, ChatOpenAICompat]] = None) -> str:
+        """Call the LLM (default: self.llm) unless the same request was answered before."""
+        llm = llm or self.llm
+        if self.cache is None:
+            return llm.invoke(messages, format=schema)
+        key = ExtractionCache.key(llm, messages, schema)
+        reply = self.cache.get(key)
+        if reply is None:
+            reply = llm.invoke(messages, format=schema)
+            self.cache.set(key, reply)
+        return reply
     
     def extract_entities_and_relationships(self, text: str) -> str:
         """
@@ -145,7 +301,7 @@ class KnowledgeGraphExtractor:
             JSON string containing entities and relationships
         """
         messages = self.entity_prompt.format(text=text)
-        return self.llm.invoke(messages)
+        return self._invoke(messages, TRIPLES_SCHEMA)
     
     def generate_entity_index(self, triples: str, original_text: str) -> str:
         """
@@ -159,9 +315,9 @@ class KnowledgeGraphExtractor:
             JSON string containing entity index
         """
         messages = self.index_prompt.format(question=triples, text=original_text)
-        return self.llm.invoke(messages)
+        return self._invoke(messages, INDEX_SCHEMA, self.index_llm)
     
-    def extract_complete_knowledge_graph(self, text: str) -> Tuple[str, str]:
+    def extract_complete_knowledge_graph(self, text: str) -> Tuple[str, Optional[str]]:
         """
         Complete pipeline: extract entities, relationships, and generate index.
         
@@ -169,8 +325,11 @@ class KnowledgeGraphExtractor:
             text: Input text to process
             
         Returns:
-            Tuple of (triples_json, key_values_json)
+            Tuple of (triples_json, key_values_json). With the combined call
+            key_values_json is None and triples_json also holds "entity_index".
         """
+        if not self.legacy:
+            return self._invoke(self.combined_prompt.format(text=text), COMBINED_SCHEMA), None
         triples = self.extract_entities_and_relationships(text)
         key_values = self.generate_entity_index(triples, text)
         return triples, key_values
@@ -180,7 +339,7 @@ class KnowledgeGraphBuilder:
     """Main class for building and storing knowledge graphs"""
     
     def __init__(self, neo4j_uri: str, neo4j_user: str, neo4j_password: str,
-                 model: str = "gemma3:1b"):
+                 model: str = DEFAULT_MODEL):
         """
         Initialize the knowledge graph builder.
         
@@ -194,59 +353,154 @@ class KnowledgeGraphBuilder:
         self.neo4j = Neo4jLightRAG(
             uri=neo4j_uri,
             user=neo4j_user,
-            password=neo4j_password
+            password=neo4j_password,
+            ensure_schema=True
         )
+        # Extraction results from every chunk, one compact JSON record per line
+        self._archive = open(ARCHIVE_PATH, "ab", buffering=1 << 20)
+        # Archive records are serialized and written off the chunk's critical path;
+        # one thread keeps them in order without locking the file
+        self._archive_pool = ThreadPoolExecutor(max_workers=1)
+        self._unsynced_records = 0
+        # Graph writes buffered between begin_batch() and flush_batch(). _batch_lock
+        # guards the buffer and _seen_entities and is never held during a Neo4j load;
+        # _load_lock keeps loads in order, so relationships find the entities of earlier batches
+        self._batch_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._batching = False
+        self._flush_every = 0
+        self._pending_chunks = 0
+        self._pending_entities: List[Dict] = []
+        self._pending_rels: List[Dict] = []
+        self._pending_index: List[Dict] = []
+        # Sanitized names of entities already written; their rows are not sent again
+        self._seen_entities: Set[str] = set()
     
-    @staticmethod
-    def clean_code_fence(s: str) -> str:
+    def close(self) -> None:
+        """Finish pending archive writes, flush the extraction archive and close the LLM clients."""
+        self._archive_pool.shutdown(wait=True)
+        self._sync_archive()
+        self._archive.close()
+        self.extractor.close()
+    
+    def begin_batch(self, flush_every: int = 50) -> None:
         """
-        Remove markdown code fences from LLM output.
+        Buffer the graph writes of process_chunk instead of loading every chunk separately.
         
         Args:
-            s: String potentially containing ```json ... ```
-            
-        Returns:
-            Clean JSON string
+            flush_every: Load the buffered chunks into Neo4j after this many chunks
         """
-        s = s.strip()
-        if s.startswith("```"):
-            lines = s.splitlines()
-            lines = lines[1:]  # Drop first line (```json or ```)
-            if lines and lines[-1].strip() == "```":
-                lines = lines[:-1]  # Drop closing ```
-            s = "\n".join(lines).strip()
-        return s
-    
-    def save_extraction_results(self, triples: str, key_values: str, 
+        with self._batch_lock:
+            self._batching = True
+            self._flush_every = flush_every
+    
+    def preload_seen_entities(self) -> None:
+        """Mark every entity already in Neo4j as written, so reruns do not resend them."""
+        names = self.neo4j.entity_names()
+        with self._batch_lock:
+            self._seen_entities.update(names)
+    
+    def _new_entities(self, entities: List[Dict]) -> List[Dict]:
+        """Drop entities that were already written or appear twice. Caller holds _batch_lock."""
+        # Keyed by the stored (sanitized) name; the first type seen wins, as with MERGE
+        new = {}
+        for entity in entities:
+            name = sanitize_label(entity['name'])
+            if name not in self._seen_entities and name not in new:
+                new[name] = entity
+        return list(new.values())
+    
+    def flush_batch(self) -> None:
+        """Load all buffered chunks into Neo4j and stop buffering."""
+        with self._batch_lock:
+            self._batching = False
+        self._flush_pending()
+    
+    def _claim_entities(self, entities: List[Dict]) -> List[Dict]:
+        """
+        Return the entities not written yet and mark them as written, so a
+        concurrent load does not send them too. Caller holds _batch_lock.
+        """
+        entities = self._new_entities(entities)
+        self._seen_entities.update(sanitize_label(entity['name']) for entity in entities)
+        return entities
+    
+    def _release_entities(self, entities: List[Dict]) -> None:
+        """Undo _claim_entities for entities whose load failed."""
+        with self._batch_lock:
+            self._seen_entities.difference_update(sanitize_label(entity['name']) for entity in entities)
+    
+    def _flush_pending(self) -> None:
+        """
+        Load the buffered chunks with one bulk load.
+        
+        The buffer is taken under _batch_lock and loaded outside it, so other
+        workers keep buffering their results meanwhile. A batch that fails is
+        logged and dropped (its results stay in the JSONL archive) instead of
+        being retried by every following chunk.
+        """
+        with self._load_lock:
+            with self._batch_lock:
+                chunks, rels, index = self._pending_chunks, self._pending_rels, self._pending_index
+                entities = self._claim_entities(self._pending_entities)
+                self._pending_chunks = 0
+                self._pending_entities = []
+                self._pending_rels = []
+                self._pending_index = []
+            if not chunks:
+                return
+            
+            try:
+                load_lightrag_data(self.neo4j, entities, rels, index)
+            except Exception:
+                self._release_entities(entities)
+                logger.exception("❌ Dropped a batch of %d chunks that failed to load into Neo4j "
+                                 "(see %s for its extraction results)", chunks, ARCHIVE_PATH)
+    
+    def save_extraction_results(self, triples: str, key_values: Optional[str], 
                                name: str) -> Tuple[Dict, Dict]:
         """
-        Clean, parse, and save extraction results to JSON file.
+        Parse and append extraction results to the JSONL archive.
         
         Args:
             triples: Raw triples JSON from LLM
-            key_values: Raw key-values JSON from LLM
-            name: Identifier for the output file
+            key_values: Raw key-values JSON from LLM, or None if `triples`
+                came from the combined call and also holds "entity_index"
+            name: Identifier of the chunk in the archive
             
         Returns:
             Tuple of (triples_dict, key_values_dict)
         """
-        triples_json = self.clean_code_fence(triples)
-        key_values_json = self.clean_code_fence(key_values)
-        
-        triples_dict = json.loads(triples_json)
-        key_values_dict = json.loads(key_values_json)
+        triples_dict = orjson.loads(triples)
+        if key_values is None:
+            key_values_dict = {"entity_index": triples_dict.pop("entity_index", [])}
+        else:
+            key_values_dict = orjson.loads(key_values)
         
         # Save to file for debugging/archiving
         output_data = {
+            "chunk": name,
             "triples": triples_dict,
             "key_values": key_values_dict
         }
-        with open(f"knowledge_graph_data_{name}.json", "w") as f:
-            json.dump(output_data, f, indent=2)
+        self._archive_pool.submit(self._write_archive_record, output_data)
         
         return triples_dict, key_values_dict
     
-    def process_chunk(self, text: str, chunk_id: int) -> bool:
+    def _write_archive_record(self, output_data: Dict) -> None:
+        """Append one record to the archive (runs on _archive_pool)."""
+        self._archive.write(orjson.dumps(output_data) + b"\n")
+        self._unsynced_records += 1
+        if self._unsynced_records >= ARCHIVE_FSYNC_EVERY:
+            self._sync_archive()
+    
+    def _sync_archive(self) -> None:
+        """Flush the archive buffer and fsync it to disk."""
+        self._archive.flush()
+        os.fsync(self._archive.fileno())
+        self._unsynced_records = 0
+    
+    def process_chunk(self, text: str, chunk_id: Union[int, str]) -> bool:
         """
         Complete pipeline for processing a text chunk into knowledge graph.
         
@@ -254,7 +508,7 @@ class KnowledgeGraphBuilder:
         1. Extract entities and relationships
         2. Generate entity index
         3. Save results to JSON
-        4. Load into Neo4j database
+        4. Load into Neo4j database (buffered when begin_batch() is active)
         
         Args:
             text: Text chunk to process
@@ -272,17 +526,42 @@ class KnowledgeGraphBuilder:
         )
         
         # Load into Neo4j
-        load_lightrag_data(
-            self.neo4j,
-            saved_triples['entities'],
-            saved_triples['relationships'],
-            saved_key_values['entity_index']
-        )
+        self._store_results(saved_triples, saved_key_values)
         
         return True
     
+    def _store_results(self, saved_triples: Dict, saved_key_values: Dict) -> None:
+        """Buffer parsed results while begin_batch() is active, otherwise load them now."""
+        with self._batch_lock:
+            batching = self._batching
+            if batching:
+                self._pending_entities.extend(self._new_entities(saved_triples['entities']))
+                self._pending_rels.extend(saved_triples['relationships'])
+                self._pending_index.extend(saved_key_values['entity_index'])
+                self._pending_chunks += 1
+                if self._pending_chunks < self._flush_every:
+                    return
+        
+        if batching:
+            self._flush_pending()
+            return
+        
+        with self._load_lock:
+            with self._batch_lock:
+                entities = self._claim_entities(saved_triples['entities'])
+            try:
+                load_lightrag_data(
+                    self.neo4j,
+                    entities,
+                    saved_triples['relationships'],
+                    saved_key_values['entity_index']
+                )
+            except Exception:
+                self._release_entities(entities)
+                raise
+    
     def create_multimodal_graph(self, image_info: Dict[str, Any], 
-                               chunk_id: int) -> str:
+                               chunk_id: Union[int, str]) -> str:
         """
         Create multimodal knowledge graph with image anchor nodes.
         
@@ -297,38 +576,34 @@ class KnowledgeGraphBuilder:
         Returns:
             Name of the created anchor node
         """
-        # Create anchor node for the image
         anchor_name = f"Image_{chunk_id}"
-        self.neo4j.create_entity(
-            entity_name=anchor_name,
-            entity_type="MultimodalAnchor",
-            properties={
-                "modality": "image",
-                "image_path": image_info['image_path'],
-                "detailed_description": image_info['detailed_description']
-            }
-        )
         
-        # Extract entities from image description
-        triples, _ = self.extractor.extract_complete_knowledge_graph(
+        # Extract entities from image description; only the triples are used here,
+        # so the per-entity index summaries of the combined call are not generated
+        triples = self.extractor.extract_entities_and_relationships(
             image_info['detailed_description']
         )
-        triples_clean = self.clean_code_fence(triples)
-        entities_from_image = json.loads(triples_clean)
+        entities_from_image = orjson.loads(triples)
         
-        # Create entity nodes and link to anchor
+        # Anchor node for the image, entity nodes and their belongs_to links,
+        # written with UNWIND statements in a single transaction
+        entities = [{
+            "name": anchor_name,
+            "type": "MultimodalAnchor",
+            "properties": {
+                "modality": "image",
+                "image_path": image_info['image_path'],
+                "detailed_description": image_info['detailed_description']
+            }
+        }]
+        relationships = []
         for entity in entities_from_image['entities']:
-            self.neo4j.create_entity(
-                entity_name=entity['name'],
-                entity_type=entity['type']
-            )
-            
-            # Create belongs_to relationship
-            self.neo4j.create_relationship(
-                source=entity['name'],
-                target=anchor_name,
-                relation_type="BELONGS_TO"
-            )
+            # Same stored name as entities loaded from text, so both link to one node
+            name = sanitize_label(entity['name'])
+            entities.append({"name": name, "type": entity['type']})
+            relationships.append({"source": name, "target": anchor_name, "relation": "BELONGS_TO"})
+        
+        self.neo4j.bulk_ingest(entities, relationships)
         
         return anchor_name
 
@@ -337,10 +612,50 @@ class KnowledgeGraphBuilder:
 from parser import PDFParser
 from multimodal_processing import MultimodalProcessor
 
-def process_pdf_document(pdf_path: str, builder: KnowledgeGraphBuilder, multimodal: MultimodalProcessor):
+# Parsed chunks buffered ahead of the LLM calls
+PARSE_QUEUE_SIZE = 4
+# Text and image chunks sent to Ollama at the same time (see OLLAMA_NUM_PARALLEL)
+LLM_WORKERS = 4
+# Consecutive text chunks are joined into one LLM call up to this many characters
+TEXT_BATCH_CHARS = 4000
+
+
+def _produce_chunks(parser: PDFParser, pdf_path: str, chunks: queue.Queue) -> None:
+    """Parse the PDF into the queue; ends with None, preceded by the exception if parsing failed."""
+    try:
+        for chunk in parser.parse_pdf(pdf_path):
+            chunks.put(chunk)
+    except Exception as e:
+        chunks.put(e)
+    finally:
+        chunks.put(None)
+
+
+def _report_chunks(done: Iterable[Future], pending: Dict[Future, str]) -> None:
+    """Print errors of finished chunk futures and forget them."""
+    for future in done:
+        label = pending.pop(future)
+        error = future.exception()
+        if error is not None:
+            print(f"    ❌ Error processing {label}: {error}")
+
+
+def _process_image_chunk(builder: KnowledgeGraphBuilder, multimodal: MultimodalProcessor,
+                         chunk: Dict[str, Any], chunk_counter: int) -> str:
+    """Describe an image chunk with the VLM and attach it to the graph."""
+    image_info = multimodal.extract_image_info(chunk['content'], chunk['context'])
+    return builder.create_multimodal_graph(image_info, chunk_counter)
+
+
+def process_pdf_document(pdf_path: str, builder: KnowledgeGraphBuilder, multimodal: MultimodalProcessor) -> None:
     """
     Process a PDF document, routing text to the graph builder and images to the multimodal processor.
     
+    Parsing runs in a background thread while text and image chunks are
+    handled by LLM_WORKERS concurrent workers, each image as soon as it is
+    parsed. Consecutive text chunks (PDF paragraphs) are sent together, up to
+    TEXT_BATCH_CHARS per call.
+    
     Args:
         pdf_path: Path to the PDF file.
         builder: KnowledgeGraphBuilder instance.
@@ -351,29 +666,69 @@ def process_pdf_document(pdf_path: str, builder: KnowledgeGraphBuilder, multimod
     
     chunk_counter = 0
     
-    for chunk in parser.parse_pdf(pdf_path):
-        chunk_counter += 1
-        chunk_id = f"pdf_chunk_{chunk_counter}"
-        
-        if chunk['type'] == 'text':
-            print(f"  📄 Processing Text Chunk {chunk_counter} (Page {chunk['page']})...")
-            try:
-                builder.process_chunk(chunk['content'], chunk_id)
-            except Exception as e:
-                print(f"    ❌ Error processing text chunk: {e}")
+    chunks: queue.Queue = queue.Queue(maxsize=PARSE_QUEUE_SIZE)
+    producer = threading.Thread(target=_produce_chunks, args=(parser, pdf_path, chunks), daemon=True)
+    producer.start()
+    
+    # Graph writes of the text chunks go to Neo4j in bulk, every 50 chunks and at the end
+    builder.begin_batch()
+    try:
+        with ThreadPoolExecutor(max_workers=LLM_WORKERS) as pool:
+            pending: Dict[Future, str] = {}  # future -> description for error messages
+            text_batch: List[Tuple[int, Dict[str, Any]]] = []  # (chunk_counter, chunk) not yet sent to the LLM
+            
+            def submit(label: str, fn: Callable[..., Any], *args: Any) -> None:
+                # Keep the parser from running arbitrarily far ahead of the LLM
+                if len(pending) >= 2 * LLM_WORKERS:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    _report_chunks(done, pending)
+                pending[pool.submit(fn, *args)] = label
+            
+            def flush_text_batch() -> None:
+                if not text_batch:
+                    return
+                first, last = text_batch[0], text_batch[-1]
+                label = f"Text Chunks {first[0]}-{last[0]} (Pages {first[1]['page']}-{last[1]['page']})"
+                print(f"  📄 Processing {label}...")
+                text = "\n\n".join(chunk['content'] for _, chunk in text_batch)
+                submit(label, builder.process_chunk, text, f"pdf_chunk_{first[0]}")
+                text_batch.clear()
+            
+            batch_chars = 0
+            while (chunk := chunks.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                chunk_counter += 1
                 
-        elif chunk['type'] == 'image':
-            print(f"  🖼️ Processing Image Chunk {chunk_counter} (Page {chunk['page']})...")
-            try:
-                image_info = multimodal.extract_image_info(chunk['content'], chunk['context'])
-                builder.create_multimodal_graph(image_info, chunk_counter)
-            except Exception as e:
-                print(f"    ❌ Error processing image chunk: {e}")
+                if chunk['type'] == 'text':
+                    if text_batch and batch_chars + len(chunk['content']) > TEXT_BATCH_CHARS:
+                        flush_text_batch()
+                        batch_chars = 0
+                    text_batch.append((chunk_counter, chunk))
+                    batch_chars += len(chunk['content'])
+                    
+                elif chunk['type'] == 'image':
+                    # The text before an image is never merged with the text after it
+                    flush_text_batch()
+                    batch_chars = 0
+                    label = f"Image Chunk {chunk_counter} (Page {chunk['page']})"
+                    print(f"  🖼️ Processing {label}...")
+                    submit(label, _process_image_chunk, builder, multimodal, chunk, chunk_counter)
+            
+            flush_text_batch()
+            _report_chunks(wait(pending).done, pending)
+    finally:
+        # Also loads what finished before an error; a failing flush is only
+        # logged, so it neither hides that error nor crashes a completed run
+        try:
+            builder.flush_batch()
+        except Exception:
+            logger.exception("❌ Could not load the last batch into Neo4j")
 
     print("✅ PDF processing complete!")
 
 
-def process_image_document(image_path: str, builder: KnowledgeGraphBuilder, multimodal: MultimodalProcessor):
+def process_image_document(image_path: str, builder: KnowledgeGraphBuilder, multimodal: MultimodalProcessor) -> None:
     """
     Process a single image document directly.
     
@@ -400,10 +755,20 @@ def process_image_document(image_path: str, builder: KnowledgeGraphBuilder, mult
         print(f"    ❌ Error processing image: {e}")
 
 
-def main():
+def main() -> None:
     """
     Main execution function demonstrating knowledge graph construction.
     """
+    arg_parser = argparse.ArgumentParser(description="Build a knowledge graph from a PDF or an image.")
+    arg_parser.add_argument("file_path", nargs="?", default="./images/sample.pdf",
+                            help="PDF or image to process (default: %(default)s)")
+    arg_parser.add_argument("--cold", action="store_true",
+                            help="skip loading the models up front, e.g. to measure cold-start latency")
+    args = arg_parser.parse_args()
+    
+    # Summaries from the Neo4j loader; per-item details are logged at DEBUG
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
     # Initialize the knowledge graph builder
     # Note: You might need to adjust credentials or make them configurable
     builder = KnowledgeGraphBuilder(
@@ -411,41 +776,45 @@ def main():
         neo4j_user="neo4j",
         neo4j_password="yourpassword" 
     )
+    # Entities from earlier runs are not written again
+    builder.preload_seen_entities()
     
     # Initialize Multimodal Processor
     multimodal = MultimodalProcessor()
     
-    # Example usage with a PDF or Image
-    # Check if a file path is provided via command line, otherwise use a default or prompt
-    import sys
-    import os
+    file_path = args.file_path
     
-    file_path = "./images/sample.pdf" # Default
-    if len(sys.argv) > 1:
-        file_path = sys.argv[1]
-        
-    if os.path.exists(file_path):
-        file_ext = os.path.splitext(file_path)[1].lower()
+    # Load the models now so the first chunk does not pay for it
+    if not args.cold:
+        builder.extractor.llm.warm_up()
+    
+    try:
+        if os.path.exists(file_path):
+            if not args.cold:
+                multimodal.warm_up()
+            file_ext = os.path.splitext(file_path)[1].lower()
         
-        if file_ext == '.pdf':
-            process_pdf_document(file_path, builder, multimodal)
-        elif file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif']:
-            process_image_document(file_path, builder, multimodal)
-        else:
-            print(f"⚠️ Unsupported file type: {file_ext}")
-            print("Supported types: .pdf, .jpg, .jpeg, .png")
+            if file_ext == '.pdf':
+                process_pdf_document(file_path, builder, multimodal)
+            elif file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif']:
+                process_image_document(file_path, builder, multimodal)
+            else:
+                print(f"⚠️ Unsupported file type: {file_ext}")
+                print("Supported types: .pdf, .jpg, .jpeg, .png")
             
-    else:
-        print(f"⚠️ File not found: {file_path}")
-        print("Usage: python pipeline.py <path_to_file>")
+        else:
+            print(f"⚠️ File not found: {file_path}")
+            print("Usage: python pipeline.py <path_to_file>")
         
-        # Fallback to original text-only test if no file found
-        print("\nRunning fallback text-only test...")
-        text1 = """Dr. Sarah Chen is a cardiologist at Stanford Medical Center who specializes in treating heart disease. In 2024, she published
+            # Fallback to original text-only test if no file found
+            print("\nRunning fallback text-only test...")
+            text1 = """Dr. Sarah Chen is a cardiologist at Stanford Medical Center who specializes in treating heart disease. In 2024, she published
 groundbreaking research on using AI to diagnose arrhythmias early. Her work showed that machine learning models can detect
 irregular heartbeats with 95% accuracy. Dr. Chen collaborates with Dr. Michael Torres, a data scientist at MIT, to develop these AI
 diagnostic tools. The research was funded by the National Heart Institute and could revolutionize cardiac care."""
-        builder.process_chunk(text1, chunk_id=1)
+            builder.process_chunk(text1, chunk_id=1)
+    finally:
+        builder.close()
 
 if __name__ == "__main__":
     main()
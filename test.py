@@ -1,9 +1,13 @@
-import ollama
+from chat import DEFAULT_KEEP_ALIVE, get_client
+
+# Both requests share one client and keep the model loaded between them (and between runs)
+client = get_client()
 
 # Text-only example
-resp = ollama.chat(
+resp = client.chat(
     model='llava:7b-v1.5-q4_1',
     messages=[{'role': 'user', 'content': 'Give me three use cases for LLaVA.'}],
+    keep_alive=DEFAULT_KEEP_ALIVE,
 )
 print(resp['message']['content'])
 
@@ -11,12 +15,13 @@ print(resp['message']['content'])
 with open('./images/presidentielles.jpg', 'rb') as f:
     img_bytes = f.read()
 
-resp = ollama.chat(
+resp = client.chat(
     model='llava:7b-v1.5-q4_1',
     messages=[{
         'role': 'user',
         'content': 'What is in this image?',
         'images': [img_bytes],
     }],
+    keep_alive=DEFAULT_KEEP_ALIVE,
 )
 print(resp['message']['content'])
@@ -1,4 +1,5 @@
 
+from collections import Counter
 from parser import PDFParser
 import sys
 
@@ -6,7 +7,7 @@ def test_parser(pdf_path):
     print(f"Testing parser on: {pdf_path}")
     parser = PDFParser()
     
-    counts = {"text": 0, "image": 0}
+    counts = Counter()
     
     for chunk in parser.parse_pdf(pdf_path):
         counts[chunk['type']] += 1
@@ -9,7 +9,8 @@ from neo4j_lightrag_storage import load_lightrag_data, Neo4jLightRAG
 neo4j = Neo4jLightRAG(
         uri="bolt://localhost:7687",
         user="neo4j",
-        password="yourpassword"  # CHANGE THIS!
+        password="yourpassword",  # CHANGE THIS!
+        ensure_schema=True
     )
 
 
@@ -24,7 +25,11 @@ s_k_v_2 = [{'key': 'Char2', 'value': 'A character who visits Plc1.'}]
 
 
 
-load_lightrag_data(neo4j, s_t_e_1, s_t_r_1, s_k_v_1)
-print('Sucessfully loaded knowledge graph1 data into Neo4j! open http://localhost:7474 to view it.')
-load_lightrag_data(neo4j, s_t_e_2, s_t_r_2, s_k_v_2)
-print('Sucessfully loaded knowledge graph2 data into Neo4j! open http://localhost:7474 to view it.')
\ No newline at end of file
+# Both loads go through the same driver and its connection pool
+try:
+    load_lightrag_data(neo4j, s_t_e_1, s_t_r_1, s_k_v_1)
+    print('Sucessfully loaded knowledge graph1 data into Neo4j! open http://localhost:7474 to view it.')
+    load_lightrag_data(neo4j, s_t_e_2, s_t_r_2, s_k_v_2)
+    print('Sucessfully loaded knowledge graph2 data into Neo4j! open http://localhost:7474 to view it.')
+finally:
+    neo4j.close()
\ No newline at end of file